@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-15 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_message_provider_reference'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='status',
+            field=models.CharField(choices=[('INITIATED', 'Initiated'), ('QUEUED', 'Queued'), ('SENT', 'Sent'), ('DELIVERED', 'Delivered'), ('FAILED', 'Failed'), ('OVERDUE', 'Overdue')], default='INITIATED', max_length=20),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-15 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_alter_message_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['status', 'sent_at'], name='msg_status_sent_at_idx'),
+        ),
+    ]
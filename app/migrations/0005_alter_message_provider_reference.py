@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-15 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_message_msg_status_sent_at_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='provider_reference',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+    ]
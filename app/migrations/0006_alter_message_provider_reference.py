@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-15 16:59
+
+from django.db import migrations, models
+
+
+def blank_provider_reference_to_null(apps, schema_editor):
+    # Unsent messages were stored with an empty reference, which would
+    # collide on the unique index
+    Message = apps.get_model('app', 'Message')
+    Message.objects.filter(provider_reference='').update(provider_reference=None)
+
+    # The mock sender gave every message the same reference. Keep it on the
+    # oldest message for each value and clear it from the rest.
+    duplicates = (
+        Message.objects.filter(provider_reference__isnull=False)
+        .values('provider_reference')
+        .annotate(count=models.Count('id'))
+        .filter(count__gt=1)
+        .values_list('provider_reference', flat=True)
+    )
+    for provider_reference in list(duplicates):
+        keep = (
+            Message.objects.filter(provider_reference=provider_reference)
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        Message.objects.filter(provider_reference=provider_reference).exclude(id=keep).update(
+            provider_reference=None
+        )
+
+
+def null_provider_reference_to_blank(apps, schema_editor):
+    # Cleared duplicate references can't be restored, so every NULL reverts
+    # to the empty string the previous schema used for "no reference"
+    Message = apps.get_model('app', 'Message')
+    Message.objects.filter(provider_reference__isnull=True).update(provider_reference='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_alter_message_provider_reference'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='provider_reference',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.RunPython(blank_provider_reference_to_null, null_provider_reference_to_blank),
+        migrations.AlterField(
+            model_name='message',
+            name='provider_reference',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.5 on 2026-10-15 17:02
+
+from django.db import migrations, models
+
+# Old string values mapped to their new integer codes
+STATUS_CODES = {
+    'INITIATED': 0,
+    'QUEUED': 1,
+    'SENT': 2,
+    'DELIVERED': 3,
+    'FAILED': 4,
+    'OVERDUE': 5,
+}
+ENCODING_CODES = {
+    'GSM-7': 0,
+    'UCS-2': 1,
+}
+
+
+def strings_to_codes(apps, schema_editor):
+    Message = apps.get_model('app', 'Message')
+    for value, code in STATUS_CODES.items():
+        Message.objects.filter(status=value).update(status_code=code)
+    for value, code in ENCODING_CODES.items():
+        Message.objects.filter(encoding=value).update(encoding_code=code)
+
+
+def codes_to_strings(apps, schema_editor):
+    Message = apps.get_model('app', 'Message')
+    for value, code in STATUS_CODES.items():
+        Message.objects.filter(status_code=code).update(status=value)
+    for value, code in ENCODING_CODES.items():
+        Message.objects.filter(encoding_code=code).update(encoding=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_alter_message_provider_reference'),
+    ]
+
+    operations = [
+        # The string columns can't be cast in place, so the values are copied
+        # into new integer columns which then replace the originals.
+        migrations.RemoveIndex(
+            model_name='message',
+            name='msg_status_sent_at_idx',
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Initiated'), (1, 'Queued'), (2, 'Sent'), (3, 'Delivered'), (4, 'Failed'), (5, 'Overdue')], default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='encoding_code',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'GSM-7'), (1, 'UCS-2')], default=0),
+        ),
+        migrations.RunPython(strings_to_codes, codes_to_strings),
+        migrations.RemoveField(
+            model_name='message',
+            name='status',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='encoding',
+        ),
+        migrations.RenameField(
+            model_name='message',
+            old_name='status_code',
+            new_name='status',
+        ),
+        migrations.RenameField(
+            model_name='message',
+            old_name='encoding_code',
+            new_name='encoding',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['status', 'sent_at'], name='msg_status_sent_at_idx'),
+        ),
+    ]
@@ -2,19 +2,20 @@ import uuid
 from django.db import models
 
 # GSM-7 and UCS-2 encoding support
-MESSAGE_ENCODING_CHOICES = [
-    ('GSM-7', 'GSM-7'),
-    ('UCS-2', 'UCS-2'),
-]
+# Stored as small integers; the label is the name exposed by the API
+class MessageEncoding(models.IntegerChoices):
+    GSM_7 = 0, 'GSM-7'
+    UCS_2 = 1, 'UCS-2'
 
 # Message status tracking
-MESSAGE_STATUS_CHOICES = [
-    ('INITIATED', 'Initiated'),
-    ('QUEUED', 'Queued'),
-    ('SENT', 'Sent'),
-    ('DELIVERED', 'Delivered'),
-    ('FAILED', 'Failed'),
-]
+# Stored as small integers; the member name is the value exposed by the API
+class MessageStatus(models.IntegerChoices):
+    INITIATED = 0, 'Initiated'
+    QUEUED = 1, 'Queued'
+    SENT = 2, 'Sent'
+    DELIVERED = 3, 'Delivered'
+    FAILED = 4, 'Failed'
+    OVERDUE = 5, 'Overdue'
 
 class Message(models.Model):
     """
@@ -25,17 +26,16 @@ class Message(models.Model):
     sender_id = models.CharField(max_length=11)
     recipient = models.CharField(max_length=15)
     text = models.TextField()
-    status = models.CharField(
-        max_length=20,
-        choices=MESSAGE_STATUS_CHOICES,
-        default='INITIATED'
+    status = models.PositiveSmallIntegerField(
+        choices=MessageStatus.choices,
+        default=MessageStatus.INITIATED
     )
-    encoding = models.CharField(
-        max_length=5,
-        choices=MESSAGE_ENCODING_CHOICES,
-        default='GSM-7'
+    encoding = models.PositiveSmallIntegerField(
+        choices=MessageEncoding.choices,
+        default=MessageEncoding.GSM_7
     )
-    provider_reference = models.CharField(max_length=255, blank=True)
+    # Null until the provider accepts the message, so unsent rows don't collide on the unique index
+    provider_reference = models.CharField(max_length=255, blank=True, null=True, unique=True)
     segment_count = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -44,7 +44,39 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Supports the periodic DLR latency sweep (status + sent_at range)
+            models.Index(fields=['status', 'sent_at'], name='msg_status_sent_at_idx'),
+        ]
+
+    @property
+    def status_name(self):
+        """
+        The status as exposed by the API, e.g. 'DELIVERED'.
+        """
+        return MessageStatus(self.status).name
+
+    def to_api_dict(self):
+        """
+        Returns the same representation as MessageSerializer without the
+        serializer overhead. Used on read-heavy response paths.
+        """
+        created_at = self.created_at.isoformat() if self.created_at else None
+        if created_at and created_at.endswith('+00:00'):
+            created_at = created_at[:-6] + 'Z'
+        return {
+            'id': str(self.id),
+            'client_message_id': self.client_message_id,
+            'provider_reference': self.provider_reference,
+            'sender_id': self.sender_id,
+            'recipient': self.recipient,
+            'text': self.text,
+            'status': self.status_name,
+            'encoding': self.get_encoding_display(),
+            'segment_count': self.segment_count,
+            'created_at': created_at,
+        }
 
     def __str__(self):
-        return f"Message to {self.recipient} (Status: {self.status})"
+        return f"Message to {self.recipient} (Status: {self.status_name})"
 
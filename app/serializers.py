@@ -5,8 +5,21 @@ class MessageSerializer(serializers.ModelSerializer):
     """
     Serializer for the Message model.
     """
+    # Status and encoding are stored as integers but exposed by name
+    status = serializers.CharField(source='status_name', read_only=True)
+    encoding = serializers.CharField(source='get_encoding_display', read_only=True)
+
     class Meta:
         model = Message
         fields = ['id', 'client_message_id', 'provider_reference', 'sender_id', 'recipient', 'text', 'status', 'encoding', 'segment_count', 'created_at']
         read_only_fields = ['id', 'status', 'provider_reference', 'encoding', 'client_message_id', 'segment_count', 'created_at']
 
+class MessageBulkCreateSerializer(MessageSerializer):
+    """
+    Serializer for items submitted to the bulk ingest endpoint.
+    Each item carries its own client_message_id for idempotency.
+    """
+    class Meta(MessageSerializer.Meta):
+        read_only_fields = ['id', 'status', 'provider_reference', 'encoding', 'segment_count', 'created_at']
+        # Duplicates are resolved by the unique constraint at insert time
+        extra_kwargs = {'client_message_id': {'validators': []}}
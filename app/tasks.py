@@ -1,65 +1,73 @@
 import os
-import math
-import time
 import uuid # <-- new import for generating mock provider reference
 from celery import shared_task
 from celery.exceptions import MaxRetriesExceededError
 from django.utils import timezone
-from .models import Message
+from .models import Message, MessageEncoding, MessageStatus
 
 # Get DLR timeout from environment variables
 DLR_TIMEOUT_MINUTES = int(os.environ.get('SMS_DLR_TIMEOUT_MINUTES', 5))
 
 # Rate limit settings
 MESSAGE_THROUGHPUT_PER_SECOND = 10  # N msg/sec
-THROTTLING_DELAY_MS = 1000 / MESSAGE_THROUGHPUT_PER_SECOND # Delay in ms
 
-@shared_task(bind=True, default_retry_delay=60, max_retries=5)
-def send_message_task(self, message_id):
+# Characters that can be sent using the GSM-7 encoding
+GSM7_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789\r\n@£$¥èéùìòÇØøÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#%&'()*+,-./:;<=>?¡¿")
+
+# Translation table that deletes every GSM-7 character. Translating a text with
+# it leaves only the characters that force UCS-2, and the scan runs in C.
+_GSM7_DELETE_TABLE = dict.fromkeys(map(ord, GSM7_CHARS))
+
+# Throughput windowing is enforced by the Celery worker via `rate_limit`, so no
+# worker slot is held sleeping. Note that Celery applies the limit per worker
+# instance; a cluster-wide limit would need a shared token bucket (e.g. in Redis).
+@shared_task(bind=True, rate_limit=f'{MESSAGE_THROUGHPUT_PER_SECOND}/s', default_retry_delay=60, max_retries=5)
+def send_message_task(self, message_id, text=None):
     """
     Celery task to handle sending a message with rate-limiting and retries.
+    The enqueuer passes the message text so the row doesn't have to be read back;
+    tasks enqueued with only an ID fall back to loading it.
     """
-    # Simulate throughput windowing
-    # This is a very simple form of rate limiting. A more robust solution
-    # would use a distributed lock or a dedicated rate-limiting library.
-    time.sleep(THROTTLING_DELAY_MS / 1000)
-
     try:
-        message = Message.objects.get(id=message_id)
+        if text is None:
+            text = Message.objects.values_list('text', flat=True).get(id=message_id)
 
         # Simulate sending the message to an external provider
         # Here, you would replace this with actual API calls to an SMPP-style provider
-        if message.status == 'INITIATED':
-            print(f"Simulating sending message: {message_id}")
-            
-            # First, update the status to QUEUED as it's being processed
-            message.status = 'QUEUED'
-            message.sent_at = timezone.now()
-            
-            # Calculate encoding and segment count
-            # A very basic calculation for demonstration
-            if set(message.text) <= set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789\r\n@£$¥èéùìòÇØøÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#%&'()*+,-./:;<=>?¡¿"):
-                message.encoding = 'GSM-7'
-                message.segment_count = math.ceil(len(message.text) / 160)
-            else:
-                message.encoding = 'UCS-2'
-                message.segment_count = math.ceil(len(message.text) / 70)
-            
-            # Assign a mock provider reference
-            message.provider_reference = "provider_ref_123"
-            message.save()
-            
-            # Simulate a successful send, next status is 'SENT'
-            message.status = 'SENT'
-            message.save()
+        print(f"Simulating sending message: {message_id}")
 
-            print(f"Message {message.id} successfully sent with provider reference: {message.provider_reference}")
-            return 'Message sent'
-        
+        # Calculate encoding and segment count
+        # A very basic calculation for demonstration
+        if not text.translate(_GSM7_DELETE_TABLE):
+            encoding = MessageEncoding.GSM_7
+            segment_count = -(-len(text) // 160) or 1
         else:
-            # If the task is called for a message that has already been sent
-            print(f"Message {message_id} already processed. Status: {message.status}")
-            return 'Already processed'
+            encoding = MessageEncoding.UCS_2
+            segment_count = -(-len(text) // 70) or 1
+
+        # Assign a mock provider reference
+        provider_reference = f"provider_ref_{uuid.uuid4().hex}"
+
+        # Transition INITIATED -> SENT in a single conditional UPDATE. The status
+        # filter makes the transition atomic, so a duplicate task delivery for a
+        # message that has already been sent updates no rows.
+        now = timezone.now()
+        updated = Message.objects.filter(id=message_id, status=MessageStatus.INITIATED).update(
+            status=MessageStatus.SENT,
+            sent_at=now,
+            encoding=encoding,
+            segment_count=segment_count,
+            provider_reference=provider_reference,
+            updated_at=now,
+        )
+
+        if updated:
+            print(f"Message {message_id} successfully sent with provider reference: {provider_reference}")
+            return 'Message sent'
+
+        # If the task is called for a message that has already been sent
+        print(f"Message {message_id} already processed or no longer exists.")
+        return 'Already processed'
 
     except Message.DoesNotExist:
         # Don't retry if the message object no longer exists
@@ -83,17 +91,16 @@ def check_dlr_latency():
     """
     timeout_threshold = timezone.now() - timezone.timedelta(minutes=DLR_TIMEOUT_MINUTES)
     
-    overdue_messages = Message.objects.filter(
-        status='SENT',
+    # Mark every overdue message in a single UPDATE so they drop out of
+    # subsequent sweeps, and raise one aggregate alert for the batch.
+    overdue_count = Message.objects.filter(
+        status=MessageStatus.SENT,
         sent_at__lte=timeout_threshold
-    )
+    ).update(status=MessageStatus.OVERDUE, updated_at=timezone.now())
 
-    if overdue_messages.exists():
-        for message in overdue_messages:
-            print(f"ALERT: DLR for message {message.id} is overdue. Sent at {message.sent_at}.")
-            # You would typically trigger an alert here (e.g., email, PagerDuty, etc.)
-            # For simplicity, we just print a message.
-            # You could also move them to a 'SUSPENDED' or 'OVERDUE' status
-            # to prevent them from being sent again.
+    if overdue_count:
+        print(f"ALERT: {overdue_count} message(s) have not received a DLR within {DLR_TIMEOUT_MINUTES} minutes.")
+        # You would typically trigger an alert here (e.g., email, PagerDuty, etc.)
+        # For simplicity, we just print a message.
     else:
-        print("All SENT messages have a timely DLR.")
\ No newline at end of file
+        print("All SENT messages have a timely DLR.")
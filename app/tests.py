@@ -4,7 +4,7 @@ import hashlib
 import pytest
 from django.conf import settings
 from django.urls import reverse
-from app.models import Message
+from app.models import Message, MessageEncoding, MessageStatus
 
 # Use the Django test client to make requests
 # It's a fixture provided by pytest-django
@@ -151,3 +151,477 @@ def test_dlr_webhook_missing_signature(client, mocker):
     )
     
     assert response.status_code == 403 # Forbidden
+
+@pytest.mark.django_db
+def test_create_message_idempotency_key(client, mocker):
+    """
+    Unit test to verify that repeating a create request with the same
+    Idempotency-Key returns the existing message instead of inserting a
+    duplicate row.
+    """
+    url = reverse('message-create')
+    mocker.patch('app.views.SENDER_ID_WHITELIST', frozenset({'MyCorp'}))
+    delay = mocker.patch('app.views.send_message_task.delay')
+
+    payload = {
+        "sender_id": "MyCorp",
+        "recipient": "233241234567",
+        "text": "Hello, idempotency!"
+    }
+    headers = {'HTTP_IDEMPOTENCY_KEY': 'send_msg:client_message_id_123'}
+
+    response_1 = client.post(url, json.dumps(payload), content_type="application/json", **headers)
+    assert response_1.status_code == 201
+
+    # Simulate the worker having sent the message
+    Message.objects.update(status=MessageStatus.SENT)
+
+    response_2 = client.post(url, json.dumps(payload), content_type="application/json", **headers)
+    assert response_2.status_code == 200
+    assert response_2.json()['id'] == response_1.json()['id']
+
+    # Only one message is stored and only one send is enqueued
+    assert Message.objects.count() == 1
+    assert delay.call_count == 1
+
+@pytest.mark.django_db
+def test_create_message_rejects_stop_keyword(client, mocker):
+    """
+    Unit test to verify that messages containing the "STOP" keyword are
+    rejected regardless of case.
+    """
+    url = reverse('message-create')
+    mocker.patch('app.views.SENDER_ID_WHITELIST', frozenset({'MyCorp'}))
+    delay = mocker.patch('app.views.send_message_task.delay')
+
+    payload = {
+        "sender_id": "MyCorp",
+        "recipient": "233241234567",
+        "text": "Please stop sending me messages."
+    }
+    response = client.post(
+        url,
+        json.dumps(payload),
+        content_type="application/json",
+        HTTP_IDEMPOTENCY_KEY='send_msg:client_message_id_789'
+    )
+
+    assert response.status_code == 400
+    assert Message.objects.count() == 0
+    delay.assert_not_called()
+
+@pytest.mark.django_db
+def test_dlr_webhook_marks_message_delivered(client, mocker):
+    """
+    Unit test to verify that a correctly signed DLR updates the message
+    matching the provider reference.
+    """
+    url = reverse('dlr-webhook')
+    mocker.patch('app.views.WEBHOOK_SECRET_BYTES', b'my_secret_key')
+
+    message = Message.objects.create(
+        client_message_id="dlr-test-1",
+        sender_id="MyCorp",
+        recipient="233241234567",
+        text="Hello",
+        status=MessageStatus.SENT,
+        provider_reference="provider_ref_123"
+    )
+
+    payload_bytes = json.dumps({
+        "provider_reference": "provider_ref_123",
+        "status": "DELIVERED"
+    }).encode('utf-8')
+    signature = hmac.new(b'my_secret_key', payload_bytes, hashlib.sha256).hexdigest()
+
+    response = client.post(
+        url,
+        payload_bytes,
+        content_type="application/json",
+        HTTP_X_PROVIDER_SIGNATURE=signature
+    )
+
+    assert response.status_code == 200
+    message.refresh_from_db()
+    assert message.status == MessageStatus.DELIVERED
+    assert message.delivered_at is not None
+
+@pytest.mark.django_db
+def test_dlr_webhook_batch(client, mocker):
+    """
+    Unit test to verify that a list of receipts is applied in one request
+    and that unknown provider references are reported back.
+    """
+    url = reverse('dlr-webhook')
+    mocker.patch('app.views.WEBHOOK_SECRET_BYTES', b'my_secret_key')
+
+    for i in range(2):
+        Message.objects.create(
+            client_message_id=f"dlr-batch-{i}",
+            sender_id="MyCorp",
+            recipient="233241234567",
+            text="Hello",
+            status=MessageStatus.SENT,
+            provider_reference=f"provider_ref_{i}"
+        )
+
+    payload_bytes = json.dumps([
+        {"provider_reference": "provider_ref_0", "status": "DELIVERED"},
+        {"provider_reference": "provider_ref_1", "status": "FAILED"},
+        {"provider_reference": "provider_ref_unknown", "status": "DELIVERED"},
+    ]).encode('utf-8')
+    signature = hmac.new(b'my_secret_key', payload_bytes, hashlib.sha256).hexdigest()
+
+    response = client.post(
+        url,
+        payload_bytes,
+        content_type="application/json",
+        HTTP_X_PROVIDER_SIGNATURE=signature
+    )
+
+    assert response.status_code == 200
+    assert response.json()['processed'] == 2
+    assert response.json()['not_found'] == ["provider_ref_unknown"]
+    assert response.json()['skipped'] == []
+    assert Message.objects.get(provider_reference="provider_ref_0").status == MessageStatus.DELIVERED
+    assert Message.objects.get(provider_reference="provider_ref_1").status == MessageStatus.FAILED
+
+@pytest.mark.django_db
+def test_bulk_create_messages(client, mocker):
+    """
+    Unit test to verify that the bulk endpoint inserts a batch of messages,
+    enqueues only the new ones and stays idempotent on resubmission.
+    """
+    url = reverse('message-bulk-create')
+    mocker.patch('app.views.SENDER_ID_WHITELIST', frozenset({'MyCorp'}))
+    group = mocker.patch('app.views.group')
+
+    payload = [
+        {
+            "client_message_id": f"bulk-{i}",
+            "sender_id": "MyCorp",
+            "recipient": "233241234567",
+            "text": f"Hello {i}"
+        }
+        for i in range(3)
+    ]
+
+    response_1 = client.post(url, json.dumps(payload), content_type="application/json")
+    assert response_1.status_code == 201
+    assert len(response_1.json()) == 3
+    assert Message.objects.count() == 3
+    assert len(list(group.call_args.args[0])) == 3
+
+    # Resubmitting the same batch after the messages were sent does not
+    # create or enqueue anything new
+    Message.objects.update(status=MessageStatus.SENT)
+    group.reset_mock()
+    response_2 = client.post(url, json.dumps(payload), content_type="application/json")
+    assert response_2.status_code == 200
+    assert Message.objects.count() == 3
+    group.assert_not_called()
+
+@pytest.mark.django_db
+def test_send_message_task_single_update(django_assert_num_queries):
+    """
+    Unit test to verify that the send task marks a message SENT with a
+    single UPDATE when the text is passed in, and is a no-op on redelivery.
+    """
+    from app.tasks import send_message_task
+
+    message = Message.objects.create(
+        client_message_id="task-test-1",
+        sender_id="MyCorp",
+        recipient="233241234567",
+        text="Hello, ça va?"
+    )
+
+    with django_assert_num_queries(1):
+        assert send_message_task(str(message.id), message.text) == 'Message sent'
+
+    message.refresh_from_db()
+    assert message.status == MessageStatus.SENT
+    assert message.encoding == MessageEncoding.UCS_2
+    assert message.segment_count == 1
+    assert message.provider_reference
+
+    assert send_message_task(str(message.id), message.text) == 'Already processed'
+
+@pytest.mark.django_db
+def test_message_detail_cached(client, settings, django_assert_num_queries):
+    """
+    Unit test to verify that message detail responses are served from the
+    cache on repeated polls.
+    """
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+    message = Message.objects.create(
+        client_message_id="detail-test-1",
+        sender_id="MyCorp",
+        recipient="233241234567",
+        text="Hello",
+        status=MessageStatus.DELIVERED
+    )
+    url = reverse('message-detail', kwargs={'pk': message.id})
+
+    with django_assert_num_queries(1):
+        response_1 = client.get(url)
+    with django_assert_num_queries(0):
+        response_2 = client.get(url)
+
+    assert response_1.status_code == response_2.status_code == 200
+    assert response_2.json()['id'] == str(message.id)
+
+@pytest.mark.django_db
+def test_message_to_api_dict_matches_serializer():
+    """
+    Unit test to verify that the hand-written projection used on read paths
+    stays in sync with MessageSerializer.
+    """
+    from app.serializers import MessageSerializer
+
+    message = Message.objects.create(
+        client_message_id="projection-test-1",
+        sender_id="MyCorp",
+        recipient="233241234567",
+        text="Hello"
+    )
+    message.refresh_from_db()
+
+    assert message.to_api_dict() == dict(MessageSerializer(message).data)
+
+@pytest.mark.django_db(transaction=True)
+def test_provider_reference_migration_clears_duplicates():
+    """
+    Migration test to verify that making provider_reference unique succeeds
+    on databases where the mock sender stored the same reference repeatedly.
+    """
+    from django.db import connection
+    from django.db.migrations.executor import MigrationExecutor
+
+    before = [('app', '0005_alter_message_provider_reference')]
+    after = [('app', '0006_alter_message_provider_reference')]
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(before)
+    try:
+        OldMessage = executor.loader.project_state(before).apps.get_model('app', 'Message')
+        for i, provider_reference in enumerate(["provider_ref_123", "provider_ref_123", ""]):
+            OldMessage.objects.create(
+                client_message_id=f"migration-test-{i}",
+                sender_id="MyCorp",
+                recipient="233241234567",
+                text="Hello",
+                status='SENT',
+                provider_reference=provider_reference
+            )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(after)
+
+        NewMessage = executor.loader.project_state(after).apps.get_model('app', 'Message')
+        assert NewMessage.objects.filter(provider_reference="provider_ref_123").count() == 1
+        assert NewMessage.objects.filter(provider_reference__isnull=True).count() == 2
+    finally:
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+@pytest.mark.django_db
+def test_message_detail_cache_unavailable(client, mocker):
+    """
+    Unit test to verify that message detail reads fall back to the database
+    when the cache backend is unreachable.
+    """
+    mocker.patch('app.views.cache.get', side_effect=ConnectionError("cache down"))
+    mocker.patch('app.views.cache.set', side_effect=ConnectionError("cache down"))
+
+    message = Message.objects.create(
+        client_message_id="detail-test-2",
+        sender_id="MyCorp",
+        recipient="233241234567",
+        text="Hello"
+    )
+
+    response = client.get(reverse('message-detail', kwargs={'pk': message.id}))
+
+    assert response.status_code == 200
+    assert response.json()['id'] == str(message.id)
+
+@pytest.mark.django_db
+def test_create_message_retry_after_broker_failure(client, mocker):
+    """
+    Unit test to verify that a message whose enqueue failed is enqueued
+    again when the client retries with the same Idempotency-Key.
+    """
+    url = reverse('message-create')
+    mocker.patch('app.views.SENDER_ID_WHITELIST', frozenset({'MyCorp'}))
+    delay = mocker.patch(
+        'app.views.send_message_task.delay',
+        side_effect=[ConnectionError("broker down"), None]
+    )
+
+    payload = {
+        "sender_id": "MyCorp",
+        "recipient": "233241234567",
+        "text": "Hello, retry!"
+    }
+    headers = {'HTTP_IDEMPOTENCY_KEY': 'send_msg:client_message_id_retry'}
+
+    response_1 = client.post(url, json.dumps(payload), content_type="application/json", **headers)
+    assert response_1.status_code == 500
+
+    response_2 = client.post(url, json.dumps(payload), content_type="application/json", **headers)
+    assert response_2.status_code == 200
+
+    message = Message.objects.get()
+    assert message.status == MessageStatus.INITIATED
+    assert delay.call_count == 2
+    delay.assert_called_with(str(message.id), message.text)
+
+@pytest.mark.django_db
+def test_bulk_create_messages_retry_after_broker_failure(client, mocker):
+    """
+    Unit test to verify that resubmitting a batch whose enqueue failed
+    enqueues the stored messages again.
+    """
+    url = reverse('message-bulk-create')
+    mocker.patch('app.views.SENDER_ID_WHITELIST', frozenset({'MyCorp'}))
+    group = mocker.patch('app.views.group')
+    group.return_value.apply_async.side_effect = [ConnectionError("broker down"), None]
+
+    payload = [
+        {
+            "client_message_id": f"bulk-retry-{i}",
+            "sender_id": "MyCorp",
+            "recipient": "233241234567",
+            "text": f"Hello {i}"
+        }
+        for i in range(2)
+    ]
+
+    response_1 = client.post(url, json.dumps(payload), content_type="application/json")
+    assert response_1.status_code == 500
+    assert Message.objects.count() == 2
+
+    response_2 = client.post(url, json.dumps(payload), content_type="application/json")
+    assert response_2.status_code == 200
+    assert Message.objects.count() == 2
+    assert group.return_value.apply_async.call_count == 2
+    assert len(list(group.call_args.args[0])) == 2
+
+@pytest.mark.django_db
+def test_dlr_webhook_batch_skipped_rows_are_retryable(client, mocker):
+    """
+    Unit test to verify that receipts skipped because their row is locked
+    are answered with a retryable status instead of 200.
+    """
+    url = reverse('dlr-webhook')
+    mocker.patch('app.views.WEBHOOK_SECRET_BYTES', b'my_secret_key')
+
+    for i in range(2):
+        Message.objects.create(
+            client_message_id=f"dlr-locked-{i}",
+            sender_id="MyCorp",
+            recipient="233241234567",
+            text="Hello",
+            status=MessageStatus.SENT,
+            provider_reference=f"provider_ref_{i}"
+        )
+
+    # Simulate provider_ref_1 being locked by a concurrent transaction, which
+    # SKIP LOCKED leaves out of the result
+    mocker.patch.object(
+        Message.objects,
+        'select_for_update',
+        side_effect=lambda **kwargs: Message.objects.exclude(provider_reference="provider_ref_1")
+    )
+
+    payload_bytes = json.dumps([
+        {"provider_reference": "provider_ref_0", "status": "DELIVERED"},
+        {"provider_reference": "provider_ref_1", "status": "DELIVERED"},
+    ]).encode('utf-8')
+    signature = hmac.new(b'my_secret_key', payload_bytes, hashlib.sha256).hexdigest()
+
+    response = client.post(
+        url,
+        payload_bytes,
+        content_type="application/json",
+        HTTP_X_PROVIDER_SIGNATURE=signature
+    )
+
+    assert response.status_code == 503
+    assert response['Retry-After'] == '1'
+    assert response.json()['processed'] == 1
+    assert response.json()['skipped'] == ["provider_ref_1"]
+    assert response.json()['not_found'] == []
+    assert Message.objects.get(provider_reference="provider_ref_0").status == MessageStatus.DELIVERED
+    assert Message.objects.get(provider_reference="provider_ref_1").status == MessageStatus.SENT
+
+@pytest.mark.django_db
+def test_dlr_webhook_invalidates_cached_message(client, settings, mocker):
+    """
+    Unit test to verify that a DLR replaces a cached terminal status instead
+    of leaving the stale response in the cache.
+    """
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    mocker.patch('app.views.WEBHOOK_SECRET_BYTES', b'my_secret_key')
+
+    messages = [
+        Message.objects.create(
+            client_message_id=f"dlr-cache-{i}",
+            sender_id="MyCorp",
+            recipient="233241234567",
+            text="Hello",
+            status=MessageStatus.FAILED,
+            provider_reference=f"provider_ref_{i}"
+        )
+        for i in range(2)
+    ]
+    urls = [reverse('message-detail', kwargs={'pk': message.id}) for message in messages]
+    for url in urls:
+        assert client.get(url).json()['status'] == 'FAILED'
+
+    # One receipt through the single path and one through the batch path
+    for payload in [
+        {"provider_reference": "provider_ref_0", "status": "DELIVERED"},
+        [{"provider_reference": "provider_ref_1", "status": "DELIVERED"}],
+    ]:
+        payload_bytes = json.dumps(payload).encode('utf-8')
+        signature = hmac.new(b'my_secret_key', payload_bytes, hashlib.sha256).hexdigest()
+        response = client.post(
+            reverse('dlr-webhook'),
+            payload_bytes,
+            content_type="application/json",
+            HTTP_X_PROVIDER_SIGNATURE=signature
+        )
+        assert response.status_code == 200
+
+    for url in urls:
+        assert client.get(url).json()['status'] == 'DELIVERED'
+
+@pytest.mark.django_db
+def test_dlr_webhook_rejects_malformed_receipts(client, mocker):
+    """
+    Unit test to verify that receipts with non-string fields are rejected
+    with a 400 on both the single and batch paths.
+    """
+    url = reverse('dlr-webhook')
+    mocker.patch('app.views.WEBHOOK_SECRET_BYTES', b'my_secret_key')
+
+    cases = [
+        ([{"provider_reference": ["provider_ref_0"], "status": "DELIVERED"}], "Missing required fields."),
+        ([{"provider_reference": "provider_ref_0", "status": 3}], "Invalid status value."),
+        ({"provider_reference": {"ref": "provider_ref_0"}, "status": "DELIVERED"}, "Missing required fields."),
+        ({"provider_reference": "provider_ref_0", "status": ["DELIVERED"]}, "Invalid status value."),
+    ]
+    for payload, detail in cases:
+        payload_bytes = json.dumps(payload).encode('utf-8')
+        signature = hmac.new(b'my_secret_key', payload_bytes, hashlib.sha256).hexdigest()
+        response = client.post(
+            url,
+            payload_bytes,
+            content_type="application/json",
+            HTTP_X_PROVIDER_SIGNATURE=signature
+        )
+        assert response.status_code == 400
+        assert response.json()['detail'] == detail
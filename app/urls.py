@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import (
     MessageCreateView,
+    MessageBulkCreateView,
     MessageDetailView,
     DlrWebhookView,
 )
@@ -9,6 +10,9 @@ urlpatterns = [
     # API endpoint to create a new message
     path('messages/', MessageCreateView.as_view(), name='message-create'),
     
+    # API endpoint to create a batch of messages in one request
+    path('messages/bulk/', MessageBulkCreateView.as_view(), name='message-bulk-create'),
+    
     # API endpoint to retrieve a single message by ID
     path('messages/<uuid:pk>/', MessageDetailView.as_view(), name='message-detail'),
     
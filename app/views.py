@@ -1,19 +1,55 @@
 import os
-import hashlib
+import re
 import hmac
+import logging
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from celery import group
 from django.utils import timezone
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.conf import settings
+from django.core.cache import cache
 
-from .models import Message
-from .serializers import MessageSerializer
+from .models import Message, MessageStatus
+from .serializers import MessageBulkCreateSerializer, MessageSerializer
 from .tasks import send_message_task
-from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 # Get sender ID whitelist from environment variables
-SENDER_ID_WHITELIST = os.environ.get('SMS_SENDER_ID_WHITELIST', '').split(',')
+SENDER_ID_WHITELIST = frozenset(
+    s.strip() for s in os.environ.get('SMS_SENDER_ID_WHITELIST', '').split(',') if s.strip()
+)
+
+# Webhook secret used to verify DLR signatures, encoded once at import
+WEBHOOK_SECRET_BYTES = (
+    settings.SMS_WEBHOOK_SECRET.encode('utf-8') if settings.SMS_WEBHOOK_SECRET else None
+)
+
+# Database alias for hot read paths; falls back to the primary when no replica is configured
+READ_DB_ALIAS = 'replica' if 'replica' in settings.DATABASES else 'default'
+
+# Message detail cache timeouts (seconds). Terminal statuses rarely change, and the
+# DLR webhook invalidates the cached response when they do.
+TERMINAL_STATUSES = frozenset({MessageStatus.DELIVERED, MessageStatus.FAILED})
+TERMINAL_STATUS_CACHE_TIMEOUT = 300
+IN_FLIGHT_STATUS_CACHE_TIMEOUT = 5
+
+def invalidate_message_cache(message_ids):
+    """
+    Drops cached detail responses for messages whose status just changed.
+    """
+    keys = [f"msg:{message_id}" for message_id in message_ids]
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception:
+        logger.warning("Message cache invalidation failed for %s", keys, exc_info=True)
+
+# Case-insensitive match for the opt-out keyword, compiled once at import
+STOP_KEYWORD_RE = re.compile(r'STOP', re.IGNORECASE)
 
 class MessageCreateView(APIView):
     """
@@ -32,100 +68,188 @@ class MessageCreateView(APIView):
 
         client_message_id = idempotency_key.split(':', 1)[1]
         
-        # Check for existing message with the same client_message_id
-        # This is the core of the deduplication logic
         try:
+            serializer = MessageSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            # Validate sender ID
+            sender_id = serializer.validated_data['sender_id']
+            if sender_id not in SENDER_ID_WHITELIST:
+                return Response(
+                    {"detail": "Invalid sender ID."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Check for "STOP" keyword
+            text = serializer.validated_data['text']
+            if STOP_KEYWORD_RE.search(text):
+                return Response(
+                    {"detail": "Cannot send messages with 'STOP' keyword."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Insert directly and let the unique constraint on client_message_id
+            # do the deduplication. This skips a SELECT on the common first-time
+            # path and closes the race between concurrent duplicate requests.
+            try:
+                with transaction.atomic():
+                    message = serializer.save(client_message_id=client_message_id)
+            except IntegrityError:
+                # Return the existing record to maintain idempotency
+                existing_message = Message.objects.get(client_message_id=client_message_id)
+
+                # The row commits before the task is enqueued, so a broker failure on an
+                # earlier attempt can leave it INITIATED. Enqueue it again; the task's
+                # conditional UPDATE makes a duplicate send harmless.
+                if existing_message.status == MessageStatus.INITIATED:
+                    send_message_task.delay(str(existing_message.id), existing_message.text)
+
+                serializer = MessageSerializer(existing_message)
+                return Response(serializer.data, status=status.HTTP_200_OK)
+
+            # Enqueue the message for sending
+            print("ENQUEUED")
+            send_message_task.delay(str(message.id), message.text)
+
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class MessageBulkCreateView(APIView):
+    """
+    API endpoint to accept a batch of new messages.
+    - Each item carries its own client_message_id for idempotency.
+    - Validates every item against the sender ID whitelist and "STOP" keyword.
+    - Inserts the batch with bulk_create and enqueues unsent messages as a Celery group.
+    """
+    def post(self, request, *args, **kwargs):
+        serializer = MessageBulkCreateSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        errors = []
+        for item in serializer.validated_data:
+            if item['sender_id'] not in SENDER_ID_WHITELIST:
+                errors.append({"detail": "Invalid sender ID."})
+            elif STOP_KEYWORD_RE.search(item['text']):
+                errors.append({"detail": "Cannot send messages with 'STOP' keyword."})
+            else:
+                errors.append({})
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            new_messages = [Message(**item) for item in serializer.validated_data]
+            client_message_ids = [message.client_message_id for message in new_messages]
+
+            # Duplicates are skipped by the unique constraint on client_message_id
             with transaction.atomic():
-                existing_message = Message.objects.filter(client_message_id=client_message_id).first()
-                if existing_message:
-                    # Return the existing record to maintain idempotency
-                    serializer = MessageSerializer(existing_message)
-                    return Response(serializer.data, status=status.HTTP_200_OK)
-
-                serializer = MessageSerializer(data=request.data)
-                if not serializer.is_valid():
-                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-                # Validate sender ID
-                sender_id = serializer.validated_data['sender_id']
-                print(SENDER_ID_WHITELIST)
-                if sender_id not in SENDER_ID_WHITELIST:
-                    return Response(
-                        {"detail": "Invalid sender ID."},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Check for "STOP" keyword
-                text = serializer.validated_data['text']
-                if "STOP" in text.upper():
-                    return Response(
-                        {"detail": "Cannot send messages with 'STOP' keyword."},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                # Set client_message_id before saving
-                message = serializer.save(client_message_id=client_message_id)
-
-                # Enqueue the message for sending
-                print("ENQUEUED")
-                send_message_task.delay(message.id)
-
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+                Message.objects.bulk_create(new_messages, ignore_conflicts=True, batch_size=1000)
+
+            messages = list(Message.objects.filter(client_message_id__in=client_message_ids))
+
+            # Rows whose id matches the one generated here were inserted by this request
+            new_ids = {message.id for message in new_messages}
+            created = [message for message in messages if message.id in new_ids]
+
+            # Enqueue every message that hasn't been sent yet with a single group publish.
+            # This includes rows from an earlier submission whose publish failed after
+            # the insert committed; the task's conditional UPDATE makes repeats harmless.
+            pending = [message for message in messages if message.status == MessageStatus.INITIATED]
+            if pending:
+                group(send_message_task.s(str(message.id), message.text) for message in pending).apply_async()
+
+            return Response(
+                [message.to_api_dict() for message in messages],
+                status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+            )
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class MessageDetailView(APIView):
     """
     API endpoint to retrieve a message by its ID.
+    - Reads from the replica database when one is configured.
+    - Caches responses, for longer once the message reaches a terminal status.
     """
     def get(self, request, pk, *args, **kwargs):
+        cache_key = f"msg:{pk}"
+        # The cache is only an optimisation; if it is unavailable, read from the database
         try:
-            message = Message.objects.get(pk=pk)
-            serializer = MessageSerializer(message)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            data = cache.get(cache_key)
+        except Exception:
+            logger.warning("Message cache read failed for %s", cache_key, exc_info=True)
+            data = None
+        if data is not None:
+            return Response(data, status=status.HTTP_200_OK)
+
+        try:
+            try:
+                message = Message.objects.using(READ_DB_ALIAS).get(pk=pk)
+            except Message.DoesNotExist:
+                # A just-created message may not have reached the replica yet
+                if READ_DB_ALIAS == 'default':
+                    raise
+                message = Message.objects.get(pk=pk)
         except Message.DoesNotExist:
             return Response(
                 {"detail": "Message not found."},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        data = message.to_api_dict()
+        timeout = (
+            TERMINAL_STATUS_CACHE_TIMEOUT
+            if message.status in TERMINAL_STATUSES
+            else IN_FLIGHT_STATUS_CACHE_TIMEOUT
+        )
+        try:
+            cache.set(cache_key, data, timeout)
+        except Exception:
+            logger.warning("Message cache write failed for %s", cache_key, exc_info=True)
+        return Response(data, status=status.HTTP_200_OK)
+
 class DlrWebhookView(APIView):
     """
     Webhook endpoint to receive Delivery Receipts from the provider.
     - Updates message status to DELIVERED or FAILED.
+    - Accepts a single receipt object or a JSON list of receipts.
     - Note: This is where you would typically perform HMAC signature verification
     to ensure the request is from a trusted source.
     """
     # This helper method performs the signature validation.
     def is_valid_signature(self, request):
         try:
-            # The signature is typically sent in a custom header
-            received_signature = request.headers.get('X-Provider-Signature', '')
-            
-            # The canonical payload string for hashing, sorting keys is critical
-            # Note: We use `request.body` here instead of `request.data` to get the raw string
-            # and avoid any potential re-encoding issues
-            body = request.body.decode('utf-8')
-            
-            # Use your secret key from settings
-            secret = settings.SMS_WEBHOOK_SECRET.encode('utf-8')
+            if WEBHOOK_SECRET_BYTES is None:
+                return False
+
+            # The signature is typically sent in a custom header as a hex digest
+            received_signature = bytes.fromhex(request.headers.get('X-Provider-Signature', ''))
             
-            # Calculate the HMAC signature using SHA256
-            calculated_signature = hmac.new(
-                secret,
-                body.encode('utf-8'),
-                hashlib.sha256,
-            ).hexdigest()
-
-            print(calculated_signature)
+            # Calculate the HMAC signature using SHA256 over the raw request body
+            # Note: We use `request.body` here instead of `request.data` to hash the
+            # exact bytes that were signed and avoid any re-encoding issues.
+            # hmac.digest() is a single call into OpenSSL, without building an HMAC object.
+            calculated_signature = hmac.digest(WEBHOOK_SECRET_BYTES, request.body, 'sha256')
             
             # Compare the signatures in a constant-time manner to prevent timing attacks
             return hmac.compare_digest(calculated_signature, received_signature)
-        except (AttributeError, TypeError):
+        except (AttributeError, TypeError, ValueError):
             # Handle cases where headers or data are missing or malformed
             return False
 
 
+    # Maps a provider status to the Message fields it updates.
+    def get_status_fields(self, status_update, now):
+        if not isinstance(status_update, str):
+            return None
+        if status_update.upper() == 'DELIVERED':
+            return {'status': MessageStatus.DELIVERED, 'delivered_at': now}
+        if status_update.upper() == 'FAILED':
+            return {'status': MessageStatus.FAILED}
+        return None
+
     def post(self, request, *args, **kwargs):
         # 1. Perform HMAC signature validation first.
         if not self.is_valid_signature(request):
@@ -133,37 +257,132 @@ class DlrWebhookView(APIView):
                 {"detail": "Invalid signature."},
                 status=status.HTTP_403_FORBIDDEN
             )
+
+        # Providers may deliver several receipts in one request
+        if isinstance(request.data, list):
+            return self.process_batch(request.data)
         
         provider_data = request.data
+        if not isinstance(provider_data, dict):
+            return Response(
+                {"detail": "Invalid receipt."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         provider_reference = provider_data.get('provider_reference')
         status_update = provider_data.get('status')
         
-        if not all([provider_reference, status_update]):
+        if not all([provider_reference, status_update]) or not isinstance(provider_reference, str):
             return Response(
                 {"detail": "Missing required fields."},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            message = Message.objects.get(provider_reference=provider_reference)
-            if status_update.upper() == 'DELIVERED':
-                message.status = 'DELIVERED'
-                message.delivered_at = timezone.now()
-            elif status_update.upper() == 'FAILED':
-                message.status = 'FAILED'
-            else:
+        now = timezone.now()
+        fields = self.get_status_fields(status_update, now)
+        if fields is None:
+            return Response(
+                {"detail": "Invalid status value."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Apply the receipt in a single UPDATE rather than a SELECT followed by a save
+        updated = Message.objects.filter(provider_reference=provider_reference).update(
+            updated_at=now,
+            **fields
+        )
+        if not updated:
+            return Response(
+                {"detail": "Message with provider reference not found."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        # A receipt can still change a "terminal" status, so drop any cached response
+        invalidate_message_cache(
+            Message.objects.filter(provider_reference=provider_reference).values_list('id', flat=True)
+        )
+
+        return Response({"detail": "DLR processed successfully."}, status=status.HTTP_200_OK)
+
+    def process_batch(self, receipts):
+        """
+        Applies a list of receipts with one locking SELECT and a batched UPDATE.
+        The whole batch is rejected if any receipt is malformed, and a retryable
+        503 is returned if any receipt was skipped because its row was locked.
+        """
+        now = timezone.now()
+        updates = {}
+        for receipt in receipts:
+            if not isinstance(receipt, dict):
+                return Response(
+                    {"detail": "Invalid receipt."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            provider_reference = receipt.get('provider_reference')
+            status_update = receipt.get('status')
+            if not all([provider_reference, status_update]) or not isinstance(provider_reference, str):
+                return Response(
+                    {"detail": "Missing required fields."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            fields = self.get_status_fields(status_update, now)
+            if fields is None:
                 return Response(
                     {"detail": "Invalid status value."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            message.save()
-            return Response({"detail": "DLR processed successfully."}, status=status.HTTP_200_OK)
+            # The last receipt for a reference wins
+            updates[provider_reference] = fields
 
-        except Message.DoesNotExist:
-            return Response(
-                {"detail": "Message with provider reference not found."},
-                status=status.HTTP_404_NOT_FOUND
+        with transaction.atomic():
+            # Lock the rows being updated. Rows already locked by a concurrent DLR
+            # request are skipped rather than waited on.
+            messages = (
+                Message.objects
+                .select_for_update(skip_locked=True)
+                .only('id', 'provider_reference', 'status', 'delivered_at')
+                .in_bulk(list(updates), field_name='provider_reference')
+            )
+            for provider_reference, message in messages.items():
+                for field, value in updates[provider_reference].items():
+                    setattr(message, field, value)
+                message.updated_at = now
+
+            Message.objects.bulk_update(
+                messages.values(),
+                ['status', 'delivered_at', 'updated_at'],
+                batch_size=1000
             )
 
+        invalidate_message_cache(message.id for message in messages.values())
+
+        # Tell apart references that don't exist from rows that were skipped
+        # because they were locked
+        unmatched = [ref for ref in updates if ref not in messages]
+        skipped = set(
+            Message.objects.filter(provider_reference__in=unmatched)
+            .values_list('provider_reference', flat=True)
+        ) if unmatched else set()
+
+        result = {
+            "processed": len(messages),
+            "not_found": [ref for ref in unmatched if ref not in skipped],
+            "skipped": [ref for ref in unmatched if ref in skipped],
+        }
+
+        # Providers treat 200 as delivered, so skipped receipts must be answered with
+        # a retryable status. Reapplying the already processed receipts is harmless.
+        if skipped:
+            return Response(
+                {"detail": "Some DLRs could not be processed, please retry.", **result},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'}
+            )
 
+        return Response(
+            {"detail": "DLRs processed successfully.", **result},
+            status=status.HTTP_200_OK
+        )